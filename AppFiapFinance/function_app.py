@@ -1,45 +1,151 @@
 # __init__.py
 import azure.functions as func
 import yfinance as yf
+import json
+import os
+import random
 import time
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+
+try:
+    import orjson  # serialização bem mais rápida, se disponível
+except ImportError:
+    orjson = None
 
 app = func.FunctionApp()
 
+# Sessão HTTP compartilhada com keep-alive: reaproveita conexões TLS com o
+# Yahoo entre chamadas em vez de abrir/fechar socket a cada request.
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=0))
+
 SYMBOLS = ["PETR4.SA", "BBAS3.SA", "ITUB4.SA"]  # Ouro, Petróleo, Prata
 
-def fetch_last_price(sym: str, retries: int = 3, pause: float = 0.8):
+# Pool pequeno para as leituras fast_info (uma requisição por símbolo):
+# despachadas em paralelo, a latência fria vira ~1 RTT em vez da soma deles
+_EXECUTOR = ThreadPoolExecutor(max_workers=len(SYMBOLS))
+
+# Cache em memória por símbolo: (timestamp monotônico, preço).
+# Em instâncias quentes do Azure Functions evita bater no Yahoo a cada request
+# (e os HTTP 429 de rate limit que vêm junto).
+_CACHE: dict = {}
+_CACHE_TTL = float(os.getenv("PRICE_CACHE_TTL_SECONDS", "60"))
+
+def _last_close(df, sym: str):
+    """Extrai o último fechamento de um símbolo do DataFrame multi-index."""
+    try:
+        closes = df[sym]["Close"] if sym in df.columns else df["Close"]
+        closes = closes.dropna()
+        if not closes.empty:
+            return float(closes.iloc[-1])
+    except (KeyError, IndexError):
+        pass
+    return None
+
+def _fast_price(sym: str):
+    """Lê o último negócio de um símbolo via fast_info.
+
+    Devolve None quando o símbolo falha em definitivo (4xx, erro interno do
+    yfinance); erros transitórios (conexão, timeout, 429, 5xx) propagam para
+    o retry de quem chamou.
+    """
+    try:
+        # Chave camelCase: no yfinance 0.2.44 FastInfo.get() só resolve as
+        # chaves públicas (os aliases snake_case valem apenas em __getitem__)
+        last = yf.Ticker(sym, session=_SESSION).fast_info.get("lastPrice")
+        if last is not None and last == last:  # exclui NaN
+            return float(last)
+    except (requests.exceptions.ConnectionError,
+            requests.exceptions.Timeout):
+        raise
+    except requests.exceptions.HTTPError as e:
+        status = e.response.status_code if e.response is not None else None
+        if status is None or status >= 500 or status == 429:
+            raise
+        # 4xx definitivo deste símbolo: os demais seguem normalmente
+    except Exception:
+        # erro permanente deste símbolo (parse interno do yfinance,
+        # mudança de schema): não derruba o restante da lista
+        pass
+    return None
+
+def fetch_last_prices(symbols: list, retries: int = 3, pause: float = 0.8) -> dict:
+    """Busca os últimos preços de vários símbolos em uma única chamada ao Yahoo."""
+    now = time.monotonic()
+    prices = {}
+    pending = []
+    for sym in symbols:
+        cached = _CACHE.get(sym)
+        if cached and now - cached[0] < _CACHE_TTL:
+            prices[sym] = cached[1]
+        else:
+            prices[sym] = None
+            pending.append(sym)
+    if not pending:
+        return prices
+
     for i in range(retries):
         try:
-            df = yf.download(sym, period="1d", interval="1m", progress=False)
-            if df is not None and not df.empty:
-                return float(df["Close"].iloc[-1])
-            # Fallback diário
-            df = yf.download(sym, period="5d", interval="1d", progress=False)
-            if df is not None and not df.empty:
-                return float(df["Close"].iloc[-1])
+            # fast_info devolve o escalar direto, sem montar DataFrame de
+            # barras intraday que seria descartado logo em seguida; uma
+            # leitura por símbolo, despachadas em paralelo pelo pool
+            todo = [s for s in pending if prices[s] is None]
+            for sym, price in zip(todo, _EXECUTOR.map(_fast_price, todo)):
+                prices[sym] = price
+            # Fallback diário só para o que ficou sem cotação
+            missing = [s for s in pending if prices[s] is None]
+            if missing:
+                df = yf.download(" ".join(missing), period="5d", interval="1d",
+                                 group_by="ticker", progress=False, threads=True,
+                                 session=_SESSION)
+                for sym in missing:
+                    prices[sym] = _last_close(df, sym)
+            for sym in pending:
+                if prices[sym] is not None:
+                    _CACHE[sym] = (time.monotonic(), prices[sym])
+            if all(prices[s] is not None for s in pending):
+                return prices
+        except (requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout):
+            pass  # transitório: vale tentar de novo
+        except requests.exceptions.HTTPError as e:
+            status = e.response.status_code if e.response is not None else None
+            if status is not None and status < 500 and status != 429:
+                # 4xx definitivo (símbolo inexistente etc.): retry não ajuda
+                return prices
         except Exception:
-            pass
-        time.sleep(pause * (1.6 ** i))  # backoff
-    return None
+            # erro permanente (parse interno do yfinance, mudança de schema):
+            # dormir e repetir só atrasaria a resposta
+            return prices
+        # backoff exponencial com full jitter: instâncias concorrentes não
+        # reagendam as tentativas no mesmo instante
+        time.sleep(random.uniform(0, pause * (1.6 ** i)))
+    return prices
 
 @app.function_name(name="CommoditiesSimple")
 @app.route(route="commodities", auth_level=func.AuthLevel.ANONYMOUS)
 def commodities(req: func.HttpRequest) -> func.HttpResponse:
-    rows = []
-    for sym in SYMBOLS:
-        price = fetch_last_price(sym)
-        rows.append((sym, price))
-
-    html = [
-        "<!doctype html>",
-        "<html><head><meta charset='utf-8'><title>Commodities</title></head><body>",
-        "<h1>Últimos preços (USD)</h1>",
-        "<ul>",
-    ]
-    for sym, price in rows:
-        val = "n/d" if price is None else f"{price:.2f} USD"
-        html.append(f"<li>{sym}: {val}</li>")
-    html.append("</ul></body></html>")
-
-    return func.HttpResponse("\n".join(html), status_code=200, mimetype="text/html")
+    # Uma única requisição batched ao Yahoo cobre todos os símbolos
+    prices = fetch_last_prices(SYMBOLS)
+    rows = [(sym, prices.get(sym)) for sym in SYMBOLS]
+
+    # JSON compacto para consumidores programáticos (?format=json)
+    if req.params.get("format") == "json":
+        payload = dict(rows)
+        body = orjson.dumps(payload) if orjson else json.dumps(payload)
+        return func.HttpResponse(body, status_code=200, mimetype="application/json")
+
+    items = "".join(
+        f"<li>{sym}: {'n/d' if price is None else f'{price:.2f} USD'}</li>"
+        for sym, price in rows
+    )
+    html = (
+        "<!doctype html>"
+        "<html><head><meta charset='utf-8'><title>Commodities</title></head><body>"
+        f"<h1>Últimos preços (USD)</h1><ul>{items}</ul></body></html>"
+    )
+
+    return func.HttpResponse(html, status_code=200, mimetype="text/html")
 
@@ -5,24 +5,33 @@ import logging
 
 app = func.FunctionApp()
 
+# Resposta fixa pré-formatada fora do caminho da requisição
+_MSG_SEM_NOME = "Está funcionando, mas me fale qual o seu nome"
+
+def _extract_name(req: func.HttpRequest):
+    # Só lê/parseia o corpo quando o nome não veio na query string
+    name = req.params.get('name')
+    if name:
+        return name
+    if not req.get_body():
+        return None
+    try:
+        req_body = req.get_json()
+    except ValueError:
+        return None
+    return req_body.get('name')
+
 @app.route(route="HelloWorld", auth_level=func.AuthLevel.ANONYMOUS)
 def HelloWorld(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('Python HTTP trigger function processed a request.')
 
-    name = req.params.get('name')
-    if not name:
-        try:
-            req_body = req.get_json()
-        except ValueError:
-            pass
-        else:
-            name = req_body.get('name')
+    name = _extract_name(req)
 
     if name:
         return func.HttpResponse(f"Olá aluno(a), {name}. Esta FunctionApp http trigger funcionou!!!")
     else:
         return func.HttpResponse(
-             "Está funcionando, mas me fale qual o seu nome",
+             _MSG_SEM_NOME,
              status_code=200
 
         )
@@ -1,94 +1,197 @@
 # function_app.py
 import os
+import asyncio
+import functools
 import logging
 import urllib.parse
 import azure.functions as func
-from azure.identity import ManagedIdentityCredential
-from azure.storage.blob import ContainerClient, BlobClient
+from azure.identity.aio import ManagedIdentityCredential
+from azure.storage.blob import BlobBlock
+from azure.storage.blob.aio import BlobServiceClient, ContainerClient, BlobClient
+from azure.core.credentials import AzureSasCredential
 from azure.core.exceptions import ResourceExistsError
 
 app = func.FunctionApp()
 
+# Limite de cópias simultâneas contra o storage
+MAX_CONCURRENCY = int(os.getenv("COPY_MAX_CONCURRENCY", "16"))
+
+# Acima deste tamanho a cópia é feita por blocos paralelos (Put Block From URL)
+# em vez de uma única chamada síncrona no serviço
+LARGE_BLOB_THRESHOLD = int(os.getenv("COPY_LARGE_BLOB_THRESHOLD", str(256 * 1024 * 1024)))
+COPY_BLOCK_SIZE = int(os.getenv("COPY_BLOCK_SIZE", str(64 * 1024 * 1024)))
+
+async def _copy_large_blob(dest_client: BlobClient, src_blob_url: str, size: int,
+                           stage_sem: asyncio.Semaphore) -> None:
+    """Copia um blob grande por faixas paralelas e consolida com commit_block_list."""
+
+    async def stage(idx: int, offset: int, length: int) -> str:
+        block_id = f"{idx:08d}"
+        async with stage_sem:
+            await dest_client.stage_block_from_url(
+                block_id, src_blob_url,
+                source_offset=offset, source_length=length
+            )
+        return block_id
+
+    tasks = [
+        stage(idx, offset, min(COPY_BLOCK_SIZE, size - offset))
+        for idx, offset in enumerate(range(0, size, COPY_BLOCK_SIZE))
+    ]
+    block_ids = await asyncio.gather(*tasks)
+    await dest_client.commit_block_list([BlobBlock(block_id=b) for b in block_ids])
+
+# Clientes e credencial criados uma única vez e reaproveitados entre execuções
+# do timer: a instância quente do Functions mantém o pool de conexões HTTP e o
+# cache de token da identidade gerenciada vivos entre disparos.
+
+# Credencial gerenciada única por processo: o token IMDS (válido ~24h) fica
+# cacheado dentro do objeto e atravessa a janela quente inteira da instância
+_CRED = ManagedIdentityCredential()
+
+@functools.lru_cache(maxsize=1)
+def _get_src_container() -> ContainerClient:
+    # Cliente de listagem anônima no container público
+    return ContainerClient.from_container_url(os.environ["SOURCE_CONTAINER_URL"])
+
+@functools.lru_cache(maxsize=1)
+def _get_src_delete_container() -> ContainerClient:
+    # Cliente único autenticado pelo SAS de exclusão: os deletes compartilham
+    # pipeline e pool em vez de re-parsear uma URL completa por blob
+    return ContainerClient.from_container_url(
+        os.environ["SOURCE_CONTAINER_URL"],
+        credential=AzureSasCredential(os.environ["SOURCE_DELETE_SAS"].strip())
+    )
+
+@functools.lru_cache(maxsize=1)
+def _get_dest_service() -> BlobServiceClient:
+    # Um único service client com a versão de API fixada: pipeline (políticas,
+    # retry, auth) e pool HTTP compartilhados por todos os clientes derivados
+    return BlobServiceClient(
+        account_url=f"https://{os.environ['DEST_ACCOUNT']}.blob.core.windows.net",
+        credential=_CRED,
+        api_version="2021-12-02"
+    )
+
+@functools.lru_cache(maxsize=1)
+def _get_dest_container() -> ContainerClient:
+    return _get_dest_service().get_container_client(os.environ["DEST_CONTAINER"])
+
 # Executa a cada 5 minutos (0s de cada minuto múltiplo de 5)
 # Formato CRON: {seg} {min} {hora} {dia-mes} {mes} {dia-semana}
 @app.function_name(name="move_public_csv_timer")
 @app.timer_trigger(schedule="0 */5 * * * *", arg_name="mytimer", run_on_startup=False)
-def move_public_csv_timer(mytimer: func.TimerRequest) -> None:
+async def move_public_csv_timer(mytimer: func.TimerRequest) -> None:
     logger = logging.getLogger("move_public_csv")
     try:
         # Variáveis de ambiente
-        # URL completa do container de origem (público): ex. https://srcacct.blob.core.windows.net/publiccontainer
-        SRC_CONTAINER_URL = os.environ["SOURCE_CONTAINER_URL"]
         # Prefixo opcional para filtrar (ex.: "inputs/2025/")
         SRC_PREFIX = os.getenv("SOURCE_PREFIX", "")
-        # Destino na mesma conta/tenant da Function
-        DEST_ACCOUNT = os.environ["DEST_ACCOUNT"]
-        DEST_CONTAINER = os.environ["DEST_CONTAINER"]
+        # "1" quando o prefixo de origem só contém CSV (ex.: "inputs/csv/"):
+        # dispensa o teste de sufixo por nome no cliente
+        SRC_PREFIX_IS_CSV_ONLY = os.getenv("SOURCE_PREFIX_IS_CSV_ONLY", "0") == "1"
+        # Prefixo opcional no destino
         DEST_PREFIX = os.getenv("DEST_PREFIX", "")
         # Se fornecer um SAS de exclusão da origem, a função tentará apagar após copiar
         SRC_DELETE_SAS = os.getenv("SOURCE_DELETE_SAS", "").strip()
 
-        # Cliente de listagem anônima no container público
-        src_container = ContainerClient.from_container_url(SRC_CONTAINER_URL)
-
-        # Credencial gerenciada para escrever no destino
-        mi_cred = ManagedIdentityCredential()
+        # Clientes compartilhados entre execuções (ver getters acima)
+        # A URL completa do container de origem (público) vem de SOURCE_CONTAINER_URL:
+        # ex. https://srcacct.blob.core.windows.net/publiccontainer
+        src_container = _get_src_container()
+        dest_container = _get_dest_container()
+        # Base da URL de origem resolvida uma vez, fora do laço por blob
+        src_base_url = src_container.url
 
         copied = 0
         skipped = 0
         deleted = 0
         failed = 0
 
-        # Itera blobs com prefixo e filtra por .csv
-        for blob in src_container.list_blobs(name_starts_with=SRC_PREFIX):
-            name_lower = blob.name.lower()
-            if not name_lower.endswith(".csv"):
-                continue
+        # Concorrência limitada para não estourar o limite de requisições da conta
+        sem = asyncio.Semaphore(MAX_CONCURRENCY)
+        # Teto único para os stage_block_from_url de TODOS os blobs grandes;
+        # um semáforo por blob multiplicaria o limite (separado de `sem` para
+        # não disputar vagas com cópias que já seguram uma)
+        stage_sem = asyncio.Semaphore(MAX_CONCURRENCY)
+
+        # Exclusões pós-cópia disparadas em background, drenadas no final
+        pending_deletes = []
+
+        async def delete_source(blob_name: str) -> None:
+            nonlocal deleted, failed
+            try:
+                await _get_src_delete_container().get_blob_client(blob_name).delete_blob()
+                deleted += 1
+            except Exception as ex:
+                failed += 1
+                logger.exception("Falha ao excluir %s na origem: %s", blob_name, ex)
+
+        async def process_one(blob) -> None:
+            nonlocal copied, skipped, deleted, failed
 
             # URL pública do blob de origem (necessita container público)
             # Codifica o nome preservando '/' para subpastas
             safe_name = urllib.parse.quote(blob.name, safe="/")
-            src_blob_url = f"{src_container.url}/{safe_name}"
+            src_blob_url = f"{src_base_url}/{safe_name}"
 
             # Replica hierarquia no destino (opcionalmente com prefixo)
-            dest_blob_name = f"{DEST_PREFIX}{blob.name}"
-            dest_client = BlobClient(
-                account_url=f"https://{DEST_ACCOUNT}.blob.core.windows.net",
-                container_name=DEST_CONTAINER,
-                blob_name=dest_blob_name,
-                credential=mi_cred,
-                api_version="2021-12-02"
-            )
+            # get_blob_client reaproveita o pipeline e o pool do container
+            dest_client = dest_container.get_blob_client(f"{DEST_PREFIX}{blob.name}")
 
-            try:
-                # Se já existe no destino, considera "não é novo"
-                if dest_client.exists():
+            async with sem:
+                try:
+                    if blob.size and blob.size > LARGE_BLOB_THRESHOLD:
+                        # Blobs grandes: blocos paralelos; commit_block_list
+                        # sobrescreveria, então aqui o HEAD prévio se paga
+                        if await dest_client.exists():
+                            skipped += 1
+                            return
+                        await _copy_large_blob(dest_client, src_blob_url, blob.size, stage_sem)
+                    else:
+                        # Sem HEAD prévio: overwrite=False já falha com
+                        # ResourceExistsError se o blob não for novo, tratado abaixo
+                        # Cópia direta no serviço (Put Blob From URL)
+                        await dest_client.upload_blob_from_url(
+                            source_url=src_blob_url,
+                            overwrite=False
+                        )
+                    copied += 1
+
+                    # Se houver SAS de delete da origem, dispara a exclusão em
+                    # background sem segurar a fila de cópias
+                    if SRC_DELETE_SAS:
+                        pending_deletes.append(
+                            asyncio.create_task(delete_source(blob.name))
+                        )
+
+                except ResourceExistsError:
+                    # Concorrência: outro ciclo copiou primeiro
                     skipped += 1
+                except Exception as ex:
+                    failed += 1
+                    logger.exception("Falha ao processar %s: %s", blob.name, ex)
+
+        tasks = []
+        # Itera a listagem página a página (5000 itens) e filtra por .csv;
+        # as cópias da página atual rodam enquanto a próxima página é buscada
+        pager = src_container.list_blobs(
+            name_starts_with=SRC_PREFIX, results_per_page=5000
+        ).by_page()
+        async for page in pager:
+            async for blob in page:
+                # endswith com tupla cobre as variações de caixa sem alocar
+                # um nome minúsculo novo por blob
+                if not SRC_PREFIX_IS_CSV_ONLY and not blob.name.endswith((".csv", ".CSV", ".Csv")):
                     continue
+                tasks.append(asyncio.create_task(process_one(blob)))
 
-                # Cópia direta no serviço (Put Blob From URL)
-                dest_client.upload_blob_from_url(
-                    source_url=src_blob_url,
-                    overwrite=False
-                )
-                copied += 1
-
-                # Se houver SAS de delete da origem, tenta exclusão pós-cópia
-                if SRC_DELETE_SAS:
-                    delete_url = f"{src_blob_url}?{SRC_DELETE_SAS}"
-                    src_blob_client = BlobClient.from_blob_url(delete_url)
-                    src_blob_client.delete_blob()
-                    deleted += 1
-
-            except ResourceExistsError:
-                # Concorrência: outro ciclo copiou primeiro
-                skipped += 1
-            except Exception as ex:
-                failed += 1
-                logger.exception(f"Falha ao processar {blob.name}: {ex}")
+        if tasks:
+            await asyncio.gather(*tasks)
+        if pending_deletes:
+            await asyncio.gather(*pending_deletes, return_exceptions=True)
 
-        logger.info(f"Cópias: {copied} | Ignorados: {skipped} | Excluídos: {deleted} | Falhas: {failed}")
+        logger.info("Cópias: %d | Ignorados: %d | Excluídos: %d | Falhas: %d", copied, skipped, deleted, failed)
 
     except Exception as e:
-        logger.exception(f"Falha geral na execução do timer: {e}")
-
+        logger.exception("Falha geral na execução do timer: %s", e)
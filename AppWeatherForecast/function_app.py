@@ -2,12 +2,111 @@ import azure.functions as func
 import logging
 import requests
 import json
-from datetime import datetime
+import copy
+import gzip
+from datetime import datetime, timezone
+from collections import Counter
+from statistics import fmean
 from typing import Dict, Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FuturesTimeout
+from threading import Lock
+from cachetools import TTLCache, LRUCache
+from string import Template
 import os
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 app = func.FunctionApp()
 
+# Pool para sobrepor as chamadas HTTP independentes (previsão + qualidade do ar)
+_EXECUTOR = ThreadPoolExecutor(max_workers=8)
+
+# Com OPENWEATHER_HEDGE=1, previsão e qualidade do ar são disparadas em
+# duplicata e vale a primeira resposta — corta a cauda de latência (p99)
+# ao custo de dobrar essas chamadas
+_HEDGE = os.environ.get('OPENWEATHER_HEDGE') == '1'
+
+# Sessão compartilhada com keep-alive: as três chamadas (e as invocações
+# seguintes no worker quente) reaproveitam a mesma conexão TLS com a API
+_SESSION = requests.Session()
+_SESSION.mount("https://", requests.adapters.HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=8,
+    max_retries=requests.adapters.Retry(
+        total=2, backoff_factor=0.1, status_forcelist=[500, 502, 503, 504])
+))
+
+
+# Cache em memória por (cidade, país, idioma): dados de clima mudam em escala
+# de minutos, então repetir as 3 chamadas upstream a cada request é desperdício
+_WEATHER_CACHE = TTLCache(maxsize=512, ttl=int(os.environ.get('WEATHER_CACHE_TTL', '300')))
+_WEATHER_CACHE_LOCK = Lock()
+
+# Segunda camada: último ETag e resultado por chave, sem prazo de validade.
+# Quando o TTL expira, revalida com If-None-Match; um 304 devolve o resultado
+# já processado sem re-parsear os ~30 KB de JSON
+_ETAG_CACHE = LRUCache(maxsize=512)
+
+# HTML renderizado por chave + versão dos dados: se o resultado em cache não
+# mudou, a página tampouco muda e a renderização inteira é pulada
+_HTML_CACHE = LRUCache(maxsize=256)
+
+
+def _dumps(obj, pretty: bool = False) -> bytes:
+    """Serializa para JSON (bytes UTF-8), usando orjson quando disponível.
+    Saída compacta por padrão; indentada só com ?pretty=1"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if pretty else 0)
+    if pretty:
+        return json.dumps(obj, ensure_ascii=False, indent=2).encode('utf-8')
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def _submit_get(url: str, params: Dict, timeout: int = 10) -> list:
+    """Submete a requisição ao pool (em duplicata quando o hedge está ligado)"""
+    return [
+        _EXECUTOR.submit(_SESSION.get, url, params=params, timeout=timeout)
+        for _ in range(2 if _HEDGE else 1)
+    ]
+
+
+def _first_response(futures: list, timeout: int = 10):
+    """Retorna a primeira resposta bem-sucedida; só falha quando todas falharem"""
+    last_exc = None
+    try:
+        for future in as_completed(futures, timeout=timeout):
+            try:
+                result = future.result()
+            except requests.exceptions.RequestException as e:
+                # O gêmeo hedge ainda pode responder: segue esperando os demais
+                last_exc = e
+                continue
+            for f in futures:
+                f.cancel()
+            return result
+    except FuturesTimeout:
+        for f in futures:
+            f.cancel()
+    if last_exc is not None:
+        raise last_exc
+    raise requests.exceptions.Timeout('Nenhuma resposta dentro do timeout')
+
+
+def _loads(raw: bytes):
+    """Desserializa JSON direto dos bytes da resposta, sem decodificar para str"""
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
 
 @app.route(route="weather-data", auth_level=func.AuthLevel.ANONYMOUS, methods=["GET"])
 def get_weather_data(req: func.HttpRequest) -> func.HttpResponse:
@@ -21,65 +120,107 @@ def get_weather_data(req: func.HttpRequest) -> func.HttpResponse:
     - format: html/json (padrão: html)
     """
     logging.info('🌤️ Requisição de dados climáticos recebida')
-    
+
+    # Parâmetros da requisição
+    city = req.params.get('city', 'São Paulo')
+    country = req.params.get('country', 'BR')
+    lang = req.params.get('lang', 'pt_br')
+
+    # Despacho único na entrada: cada formato segue seu próprio caminho,
+    # sem re-testar o formato em cada ramo de erro/sucesso
+    if req.params.get('format', 'html').lower() == 'json':
+        pretty = req.params.get('pretty', '0') == '1'
+        return _handle_json(city, country, lang, pretty)
+    return _handle_html(req, city, country, lang)
+
+
+def _compress_html(req: func.HttpRequest, html: str):
+    """
+    Comprime o corpo HTML conforme o Accept-Encoding do cliente
+    (o Functions não comprime respostas Python automaticamente).
+    Retorna (bytes, encoding ou None).
+    """
+    accept = req.headers.get('Accept-Encoding', '')
+    raw = html.encode('utf-8')
+    if brotli is not None and 'br' in accept:
+        return brotli.compress(raw, quality=4), 'br'
+    if 'gzip' in accept:
+        return gzip.compress(raw, compresslevel=6), 'gzip'
+    return raw, None
+
+
+def _handle_json(city: str, country: str, lang: str, pretty: bool = False) -> func.HttpResponse:
+    """Ramo JSON: busca os dados e serializa direto, sem tocar na renderização"""
     try:
-        # Parâmetros da requisição
-        city = req.params.get('city', 'São Paulo')
-        country = req.params.get('country', 'BR')
-        lang = req.params.get('lang', 'pt_br')
-        response_format = req.params.get('format', 'html').lower()
-        
-        # Busca dados climáticos
         weather_data = fetch_weather_data(city, country, lang)
-        
+
         if not weather_data.get('success', False):
-            error_msg = weather_data.get('error', 'Erro desconhecido')
-            if response_format == 'json':
-                return func.HttpResponse(
-                    body=json.dumps({'error': error_msg}, indent=2),
-                    mimetype="application/json",
-                    status_code=400
-                )
-            else:
-                return func.HttpResponse(
-                    f"<h1>Erro</h1><p>{error_msg}</p>",
-                    mimetype="text/html",
-                    status_code=400
-                )
-        
-        if response_format == 'json':
             return func.HttpResponse(
-                body=json.dumps(weather_data, indent=2, ensure_ascii=False),
+                body=_dumps({'error': weather_data.get('error', 'Erro desconhecido')}, pretty),
                 mimetype="application/json",
-                status_code=200,
-                headers={'Content-Type': 'application/json; charset=utf-8'}
-            )
-        else:
-            # Retorna página HTML
-            html_content = generate_weather_html(weather_data, city)
-            return func.HttpResponse(
-                body=html_content,
-                mimetype="text/html",
-                status_code=200,
-                headers={'Content-Type': 'text/html; charset=utf-8'}
+                status_code=400
             )
-            
+
+        return func.HttpResponse(
+            body=_dumps(weather_data, pretty),
+            mimetype="application/json",
+            status_code=200,
+            headers={'Content-Type': 'application/json; charset=utf-8'}
+        )
+
     except Exception as e:
         logging.error(f'❌ Erro: {str(e)}')
-        
-        if response_format == 'json':
-            return func.HttpResponse(
-                body=json.dumps({'error': str(e)}, indent=2),
-                mimetype="application/json",
-                status_code=500
-            )
-        else:
+        return func.HttpResponse(
+            body=_dumps({'error': str(e)}, pretty),
+            mimetype="application/json",
+            status_code=500
+        )
+
+
+def _handle_html(req: func.HttpRequest, city: str, country: str, lang: str) -> func.HttpResponse:
+    """Ramo HTML: busca os dados e renderiza a página"""
+    try:
+        weather_data = fetch_weather_data(city, country, lang)
+
+        if not weather_data.get('success', False):
             return func.HttpResponse(
-                f"<h1>Erro ao buscar dados</h1><p>{str(e)}</p>",
+                f"<h1>Erro</h1><p>{weather_data.get('error', 'Erro desconhecido')}</p>",
                 mimetype="text/html",
-                status_code=500
+                status_code=400
             )
 
+        # generate_weather_html é pura em função dos dados: o timestamp dos
+        # metadados serve de versão para reaproveitar a página renderizada
+        html_key = (city.lower(), country.upper(), lang)
+        version = weather_data['metadata']['timestamp']
+        with _WEATHER_CACHE_LOCK:
+            cached_html = _HTML_CACHE.get(html_key)
+        if cached_html is not None and cached_html[0] == version:
+            html_content = cached_html[1]
+        else:
+            html_content = generate_weather_html(weather_data, city)
+            with _WEATHER_CACHE_LOCK:
+                _HTML_CACHE[html_key] = (version, html_content)
+
+        body, encoding = _compress_html(req, html_content)
+        headers = {'Content-Type': 'text/html; charset=utf-8', 'Vary': 'Accept-Encoding'}
+        if encoding:
+            headers['Content-Encoding'] = encoding
+        return func.HttpResponse(
+            body=body,
+            mimetype="text/html",
+            status_code=200,
+            headers=headers
+        )
+
+    except Exception as e:
+        logging.error(f'❌ Erro: {str(e)}')
+        return func.HttpResponse(
+            f"<h1>Erro ao buscar dados</h1><p>{str(e)}</p>",
+            mimetype="text/html",
+            status_code=500
+        )
+
 
 def fetch_weather_data(city: str, country: str, lang: str) -> Dict:
     """
@@ -95,8 +236,24 @@ def fetch_weather_data(city: str, country: str, lang: str) -> Dict:
     if api_key == 'demo':
         logging.warning('⚠️ Usando dados de demonstração. Configure OPENWEATHER_API_KEY.')
         return get_demo_weather_data(city, country)
-    
+
+    cache_key = (city.lower(), country.upper(), lang)
+    with _WEATHER_CACHE_LOCK:
+        cached = _WEATHER_CACHE.get(cache_key)
+    if cached is not None:
+        logging.info('📦 Cache hit para %s, %s', city, country)
+        return cached
+
     try:
+        # Caminho batched opcional: One Call 3.0 colapsa weather + forecast
+        # em uma única chamada (requer assinatura do plano One Call)
+        if os.environ.get('OPENWEATHER_USE_ONECALL') == '1':
+            weather_result = fetch_weather_onecall(city, country, lang, api_key)
+            if weather_result.get('success'):
+                with _WEATHER_CACHE_LOCK:
+                    _WEATHER_CACHE[cache_key] = weather_result
+            return weather_result
+
         # 1. Busca dados atuais (OpenWeatherMap)
         current_url = f"https://api.openweathermap.org/data/2.5/weather"
         current_params = {
@@ -106,15 +263,29 @@ def fetch_weather_data(city: str, country: str, lang: str) -> Dict:
             'lang': 'pt_br'
         }
         
-        current_response = requests.get(current_url, params=current_params, timeout=10)
-        
+        # Revalidação condicional: se já vimos esta chave, manda o ETag antigo
+        with _WEATHER_CACHE_LOCK:
+            stale = _ETAG_CACHE.get(cache_key)
+        conditional_headers = {'If-None-Match': stale['etag']} if stale else None
+
+        current_response = _SESSION.get(
+            current_url, params=current_params, timeout=10,
+            headers=conditional_headers)
+
+        if current_response.status_code == 304 and stale:
+            # Upstream não mudou: renova a janela do TTL com o resultado antigo
+            weather_result = stale['result']
+            with _WEATHER_CACHE_LOCK:
+                _WEATHER_CACHE[cache_key] = weather_result
+            return weather_result
+
         if current_response.status_code != 200:
             return {
                 'success': False,
                 'error': f'Cidade não encontrada ou erro na API: {current_response.status_code}'
             }
         
-        current_data = current_response.json()
+        current_data = _loads(current_response.content)
         
         # 2. Busca previsão de 5 dias
         forecast_url = f"https://api.openweathermap.org/data/2.5/forecast"
@@ -125,25 +296,42 @@ def fetch_weather_data(city: str, country: str, lang: str) -> Dict:
             'lang': 'pt_br',
             'cnt': 40  # 5 dias (8 previsões por dia)
         }
-        
-        forecast_response = requests.get(forecast_url, params=forecast_params, timeout=10)
-        forecast_data = forecast_response.json() if forecast_response.status_code == 200 else {}
-        
-        # 3. Busca qualidade do ar (Air Pollution)
+
+        # 3. Busca qualidade do ar (Air Pollution) - depende das coordenadas
         air_url = f"https://api.openweathermap.org/data/2.5/air_pollution"
         air_params = {
             'lat': current_data['coord']['lat'],
             'lon': current_data['coord']['lon'],
             'appid': api_key
         }
-        
-        air_response = requests.get(air_url, params=air_params, timeout=10)
-        air_data = air_response.json() if air_response.status_code == 200 else {}
+
+        # Previsão e qualidade do ar não dependem uma da outra: dispara as duas
+        # em paralelo (duplicadas sob hedge) e espera ambas
+        forecast_futures = _submit_get(forecast_url, forecast_params)
+        air_futures = _submit_get(air_url, air_params)
+
+        try:
+            forecast_response = _first_response(forecast_futures)
+            forecast_data = _loads(forecast_response.content) if forecast_response.status_code == 200 else {}
+        except requests.exceptions.RequestException:
+            forecast_data = {}
+
+        try:
+            air_response = _first_response(air_futures)
+            air_data = _loads(air_response.content) if air_response.status_code == 200 else {}
+        except requests.exceptions.RequestException:
+            air_data = {}
         
         # Processa dados
         weather_result = process_weather_data(current_data, forecast_data, air_data)
         weather_result['success'] = True
-        
+
+        etag = current_response.headers.get('ETag')
+        with _WEATHER_CACHE_LOCK:
+            _WEATHER_CACHE[cache_key] = weather_result
+            if etag:
+                _ETAG_CACHE[cache_key] = {'etag': etag, 'result': weather_result}
+
         logging.info(f'✅ Dados obtidos para {city}: {weather_result["current"]["temperature"]}°C')
         
         return weather_result
@@ -156,6 +344,127 @@ def fetch_weather_data(city: str, country: str, lang: str) -> Dict:
         return {'success': False, 'error': f'Erro ao processar dados: {str(e)}'}
 
 
+def fetch_weather_onecall(city: str, country: str, lang: str, api_key: str) -> Dict:
+    """
+    Busca dados climáticos via One Call 3.0: uma única chamada geolocalizada
+    substitui os endpoints weather + forecast (air_pollution continua à parte)
+    """
+    # Geocodifica a cidade (resultado entra no mesmo cache TTL do chamador)
+    geo_response = _SESSION.get(
+        "https://api.openweathermap.org/geo/1.0/direct",
+        params={'q': f'{city},{country}', 'limit': 1, 'appid': api_key},
+        timeout=10
+    )
+    geo_data = _loads(geo_response.content) if geo_response.status_code == 200 else []
+    if not geo_data:
+        return {'success': False, 'error': f'Cidade não encontrada: {city},{country}'}
+
+    lat, lon = geo_data[0]['lat'], geo_data[0]['lon']
+
+    # One Call e qualidade do ar em paralelo, ambos só dependem das coordenadas
+    onecall_future = _EXECUTOR.submit(
+        _SESSION.get, "https://api.openweathermap.org/data/3.0/onecall",
+        params={'lat': lat, 'lon': lon, 'appid': api_key, 'units': 'metric',
+                'lang': 'pt_br', 'exclude': 'minutely,alerts'},
+        timeout=10)
+    air_future = _EXECUTOR.submit(
+        _SESSION.get, "https://api.openweathermap.org/data/2.5/air_pollution",
+        params={'lat': lat, 'lon': lon, 'appid': api_key},
+        timeout=10)
+
+    onecall_response = onecall_future.result()
+    if onecall_response.status_code != 200:
+        return {
+            'success': False,
+            'error': f'Erro na API One Call: {onecall_response.status_code}'
+        }
+    oc = _loads(onecall_response.content)
+
+    try:
+        air_response = air_future.result()
+        air = _loads(air_response.content) if air_response.status_code == 200 else {}
+    except requests.exceptions.RequestException:
+        air = {}
+
+    oc_current = oc['current']
+    oc_daily = oc.get('daily', [])
+    oc_hourly = oc.get('hourly', [])
+
+    # Dados atuais (min/max do dia vêm do primeiro item da previsão diária)
+    today_temp = oc_daily[0]['temp'] if oc_daily else {}
+    current_weather = {
+        'temperature': round(oc_current['temp'], 1),
+        'feels_like': round(oc_current['feels_like'], 1),
+        'temp_min': round(today_temp.get('min', oc_current['temp']), 1),
+        'temp_max': round(today_temp.get('max', oc_current['temp']), 1),
+        'pressure': oc_current['pressure'],
+        'humidity': oc_current['humidity'],
+        'description': oc_current['weather'][0]['description'].capitalize(),
+        'icon': oc_current['weather'][0]['icon'],
+        'wind_speed': round(oc_current.get('wind_speed', 0) * 3.6, 1),  # m/s para km/h
+        'wind_deg': oc_current.get('wind_deg', 0),
+        'clouds': oc_current.get('clouds', 0),
+        'visibility': oc_current.get('visibility', 0) / 1000,  # metros para km
+        'sunrise': datetime.fromtimestamp(oc_current['sunrise']).strftime('%H:%M'),
+        'sunset': datetime.fromtimestamp(oc_current['sunset']).strftime('%H:%M'),
+        'country': country,
+        'city': geo_data[0].get('name', city)
+    }
+
+    # Qualidade do ar
+    air_quality = {'aqi': 0, 'status': 'Sem dados'}
+    if air.get('list'):
+        aqi = air['list'][0]['main']['aqi']
+        air_quality = {
+            'aqi': aqi,
+            'status': get_aqi_status(aqi),
+            'pm2_5': air['list'][0]['components'].get('pm2_5', 0),
+            'pm10': air['list'][0]['components'].get('pm10', 0),
+            'o3': air['list'][0]['components'].get('o3', 0),
+            'no2': air['list'][0]['components'].get('no2', 0)
+        }
+
+    # Previsão diária já vem agregada: dispensa o laço de agrupamento por dia
+    forecast_daily = []
+    for day in oc_daily[:5]:
+        dt = datetime.fromtimestamp(day['dt'])
+        forecast_daily.append({
+            'date': dt.strftime('%Y-%m-%d'),
+            'weekday': dt.strftime('%A'),
+            'temp_min': round(day['temp']['min'], 1),
+            'temp_max': round(day['temp']['max'], 1),
+            'description': day['weather'][0]['description'],
+            'icon': day['weather'][0]['icon'],
+            'humidity': day['humidity'],
+            'rain': round(day.get('rain', 0), 1)
+        })
+
+    # Previsão horária (One Call é de hora em hora: pega 24h em passos de 3)
+    forecast_hourly = []
+    for hour in oc_hourly[:24:3]:
+        forecast_hourly.append({
+            'time': datetime.fromtimestamp(hour['dt']).strftime('%H:%M'),
+            'temperature': round(hour['temp'], 1),
+            'description': hour['weather'][0]['description'].capitalize(),
+            'icon': hour['weather'][0]['icon'],
+            'humidity': hour['humidity'],
+            'wind_speed': round(hour.get('wind_speed', 0) * 3.6, 1)
+        })
+
+    return {
+        'success': True,
+        'current': current_weather,
+        'air_quality': air_quality,
+        'forecast_daily': forecast_daily,
+        'forecast_hourly': forecast_hourly,
+        'metadata': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'source': 'OpenWeatherMap One Call 3.0',
+            'update_time': datetime.now().strftime('%d/%m/%Y %H:%M:%S')
+        }
+    }
+
+
 def process_weather_data(current: Dict, forecast: Dict, air: Dict) -> Dict:
     """Processa e estrutura os dados das APIs"""
     
@@ -198,220 +507,186 @@ def process_weather_data(current: Dict, forecast: Dict, air: Dict) -> Dict:
             'no2': air['list'][0]['components'].get('no2', 0)
         }
     
-    # Previsão dos próximos dias (agrupa por dia)
+    # Previsão dos próximos dias e das próximas 24h em uma única passada pela
+    # lista: cada item alimenta o agregado diário e, nos 8 primeiros períodos
+    # (3h cada), também a previsão horária
     forecast_daily = []
+    forecast_hourly = []
     if forecast.get('list'):
         days_data = {}
-        for item in forecast['list']:
-            date = datetime.fromtimestamp(item['dt']).strftime('%Y-%m-%d')
+        for idx, item in enumerate(forecast['list']):
+            dt = datetime.fromtimestamp(item['dt'])
+            date = dt.strftime('%Y-%m-%d')
+            main = item['main']
+            weather0 = item['weather'][0]
             if date not in days_data:
                 days_data[date] = {
+                    # dia da semana derivado do datetime já parseado, em vez de
+                    # um strptime extra por dia na montagem do resumo
+                    'weekday': dt.strftime('%A'),
                     'temps': [],
                     'descriptions': [],
                     'icons': [],
                     'humidity': [],
                     'rain': 0
                 }
-            
-            days_data[date]['temps'].append(item['main']['temp'])
-            days_data[date]['descriptions'].append(item['weather'][0]['description'])
-            days_data[date]['icons'].append(item['weather'][0]['icon'])
-            days_data[date]['humidity'].append(item['main']['humidity'])
-            
+
+            day_data = days_data[date]
+            day_data['temps'].append(main['temp'])
+            day_data['descriptions'].append(weather0['description'])
+            day_data['icons'].append(weather0['icon'])
+            day_data['humidity'].append(main['humidity'])
+
             if 'rain' in item:
-                days_data[date]['rain'] += item['rain'].get('3h', 0)
-        
+                day_data['rain'] += item['rain'].get('3h', 0)
+
+            if idx < 8:
+                forecast_hourly.append({
+                    'time': dt.strftime('%H:%M'),
+                    'temperature': round(main['temp'], 1),
+                    'description': weather0['description'].capitalize(),
+                    'icon': weather0['icon'],
+                    'humidity': main['humidity'],
+                    'wind_speed': round(item['wind']['speed'] * 3.6, 1)
+                })
+
         for date, data in list(days_data.items())[:5]:
+            temps = data['temps']
             forecast_daily.append({
                 'date': date,
-                'weekday': datetime.strptime(date, '%Y-%m-%d').strftime('%A'),
-                'temp_min': round(min(data['temps']), 1),
-                'temp_max': round(max(data['temps']), 1),
-                'description': max(set(data['descriptions']), key=data['descriptions'].count),
-                'icon': max(set(data['icons']), key=data['icons'].count),
-                'humidity': round(sum(data['humidity']) / len(data['humidity'])),
+                'weekday': data['weekday'],
+                'temp_min': round(min(temps), 1),
+                'temp_max': round(max(temps), 1),
+                # Counter é O(n); max(set, key=.count) re-varria a lista inteira
+                # para cada elemento distinto
+                'description': Counter(data['descriptions']).most_common(1)[0][0],
+                'icon': Counter(data['icons']).most_common(1)[0][0],
+                'humidity': round(fmean(data['humidity'])),
                 'rain': round(data['rain'], 1)
             })
-    
-    # Previsão horária (próximas 24h)
-    forecast_hourly = []
-    if forecast.get('list'):
-        for item in forecast['list'][:8]:  # Próximas 24h (8 períodos de 3h)
-            forecast_hourly.append({
-                'time': datetime.fromtimestamp(item['dt']).strftime('%H:%M'),
-                'temperature': round(item['main']['temp'], 1),
-                'description': item['weather'][0]['description'].capitalize(),
-                'icon': item['weather'][0]['icon'],
-                'humidity': item['main']['humidity'],
-                'wind_speed': round(item['wind']['speed'] * 3.6, 1)
-            })
-    
+
     return {
         'current': current_weather,
         'air_quality': air_quality,
         'forecast_daily': forecast_daily,
         'forecast_hourly': forecast_hourly,
         'metadata': {
-            'timestamp': datetime.utcnow().isoformat(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
             'source': 'OpenWeatherMap API',
             'update_time': datetime.now().strftime('%d/%m/%Y %H:%M:%S')
         }
     }
 
 
+# Índice 0 é o fallback para AQI fora da escala 1-5
+_AQI_STATUSES = (
+    'Desconhecido',
+    'Boa',
+    'Moderada',
+    'Prejudicial para grupos sensíveis',
+    'Prejudicial',
+    'Muito prejudicial'
+)
+
+# Cor do cartão de qualidade do ar por status
+_AQI_COLORS = {
+    'Boa': '#28a745',
+    'Moderada': '#ffc107',
+    'Prejudicial para grupos sensíveis': '#fd7e14',
+    'Prejudicial': '#dc3545',
+    'Muito prejudicial': '#6f42c1'
+}
+
+
+# Pontos cardeais na ordem dos setores de 45°
+_WIND_DIRS = ('N', 'NE', 'E', 'SE', 'S', 'SW', 'W', 'NW')
+
+
 def get_aqi_status(aqi: int) -> str:
     """Retorna status da qualidade do ar"""
-    statuses = {
-        1: 'Boa',
-        2: 'Moderada',
-        3: 'Prejudicial para grupos sensíveis',
-        4: 'Prejudicial',
-        5: 'Muito prejudicial'
+    return _AQI_STATUSES[aqi] if 0 < aqi < len(_AQI_STATUSES) else _AQI_STATUSES[0]
+
+
+# Corpo fixo da resposta de demonstração, montado uma vez no import; só
+# cidade/país e os carimbos de hora variam por request
+_DEMO_TEMPLATE = {
+    'success': True,
+    'current': {
+        'temperature': 24.5,
+        'feels_like': 25.2,
+        'temp_min': 22.0,
+        'temp_max': 28.0,
+        'pressure': 1013,
+        'humidity': 65,
+        'description': 'Parcialmente nublado',
+        'icon': '02d',
+        'wind_speed': 12.5,
+        'wind_deg': 180,
+        'clouds': 40,
+        'visibility': 10.0,
+        'sunrise': '06:15',
+        'sunset': '18:45'
+    },
+    'air_quality': {
+        'aqi': 2,
+        'status': 'Moderada',
+        'pm2_5': 15.2,
+        'pm10': 25.8,
+        'o3': 45.3,
+        'no2': 18.5
+    },
+    'forecast_daily': [
+        {'date': '2025-11-05', 'weekday': 'Quarta', 'temp_min': 20, 'temp_max': 27, 'description': 'Ensolarado', 'icon': '01d', 'humidity': 60, 'rain': 0},
+        {'date': '2025-11-06', 'weekday': 'Quinta', 'temp_min': 21, 'temp_max': 28, 'description': 'Parcialmente nublado', 'icon': '02d', 'humidity': 65, 'rain': 0},
+        {'date': '2025-11-07', 'weekday': 'Sexta', 'temp_min': 19, 'temp_max': 25, 'description': 'Chuva leve', 'icon': '10d', 'humidity': 75, 'rain': 2.5},
+        {'date': '2025-11-08', 'weekday': 'Sábado', 'temp_min': 18, 'temp_max': 23, 'description': 'Nublado', 'icon': '04d', 'humidity': 70, 'rain': 0},
+        {'date': '2025-11-09', 'weekday': 'Domingo', 'temp_min': 20, 'temp_max': 26, 'description': 'Ensolarado', 'icon': '01d', 'humidity': 55, 'rain': 0}
+    ],
+    'forecast_hourly': [
+        {'time': '21:00', 'temperature': 24.5, 'description': 'Céu limpo', 'icon': '01n', 'humidity': 65, 'wind_speed': 10},
+        {'time': '00:00', 'temperature': 22.0, 'description': 'Céu limpo', 'icon': '01n', 'humidity': 70, 'wind_speed': 8},
+        {'time': '03:00', 'temperature': 20.5, 'description': 'Céu limpo', 'icon': '01n', 'humidity': 75, 'wind_speed': 7},
+        {'time': '06:00', 'temperature': 19.8, 'description': 'Parcialmente nublado', 'icon': '02d', 'humidity': 78, 'wind_speed': 9}
+    ],
+    'metadata': {
+        'source': 'Dados de Demonstração',
+        'note': '⚠️ Configure OPENWEATHER_API_KEY para dados reais'
     }
-    return statuses.get(aqi, 'Desconhecido')
+}
 
 
 def get_demo_weather_data(city: str, country: str) -> Dict:
     """Retorna dados de demonstração quando API key não está configurada"""
-    return {
-        'success': True,
-        'current': {
-            'temperature': 24.5,
-            'feels_like': 25.2,
-            'temp_min': 22.0,
-            'temp_max': 28.0,
-            'pressure': 1013,
-            'humidity': 65,
-            'description': 'Parcialmente nublado',
-            'icon': '02d',
-            'wind_speed': 12.5,
-            'wind_deg': 180,
-            'clouds': 40,
-            'visibility': 10.0,
-            'sunrise': '06:15',
-            'sunset': '18:45',
-            'country': country,
-            'city': city
-        },
-        'air_quality': {
-            'aqi': 2,
-            'status': 'Moderada',
-            'pm2_5': 15.2,
-            'pm10': 25.8,
-            'o3': 45.3,
-            'no2': 18.5
-        },
-        'forecast_daily': [
-            {'date': '2025-11-05', 'weekday': 'Quarta', 'temp_min': 20, 'temp_max': 27, 'description': 'Ensolarado', 'icon': '01d', 'humidity': 60, 'rain': 0},
-            {'date': '2025-11-06', 'weekday': 'Quinta', 'temp_min': 21, 'temp_max': 28, 'description': 'Parcialmente nublado', 'icon': '02d', 'humidity': 65, 'rain': 0},
-            {'date': '2025-11-07', 'weekday': 'Sexta', 'temp_min': 19, 'temp_max': 25, 'description': 'Chuva leve', 'icon': '10d', 'humidity': 75, 'rain': 2.5},
-            {'date': '2025-11-08', 'weekday': 'Sábado', 'temp_min': 18, 'temp_max': 23, 'description': 'Nublado', 'icon': '04d', 'humidity': 70, 'rain': 0},
-            {'date': '2025-11-09', 'weekday': 'Domingo', 'temp_min': 20, 'temp_max': 26, 'description': 'Ensolarado', 'icon': '01d', 'humidity': 55, 'rain': 0}
-        ],
-        'forecast_hourly': [
-            {'time': '21:00', 'temperature': 24.5, 'description': 'Céu limpo', 'icon': '01n', 'humidity': 65, 'wind_speed': 10},
-            {'time': '00:00', 'temperature': 22.0, 'description': 'Céu limpo', 'icon': '01n', 'humidity': 70, 'wind_speed': 8},
-            {'time': '03:00', 'temperature': 20.5, 'description': 'Céu limpo', 'icon': '01n', 'humidity': 75, 'wind_speed': 7},
-            {'time': '06:00', 'temperature': 19.8, 'description': 'Parcialmente nublado', 'icon': '02d', 'humidity': 78, 'wind_speed': 9}
-        ],
-        'metadata': {
-            'timestamp': datetime.utcnow().isoformat(),
-            'source': 'Dados de Demonstração',
-            'update_time': datetime.now().strftime('%d/%m/%Y %H:%M:%S'),
-            'note': '⚠️ Configure OPENWEATHER_API_KEY para dados reais'
-        }
-    }
+    demo = copy.deepcopy(_DEMO_TEMPLATE)
+    demo['current']['country'] = country
+    demo['current']['city'] = city
+    demo['metadata']['timestamp'] = datetime.now(timezone.utc).isoformat()
+    demo['metadata']['update_time'] = datetime.now().strftime('%d/%m/%Y %H:%M:%S')
+    return demo
 
 
-def generate_weather_html(data: Dict, city: str) -> str:
-    """Gera página HTML com os dados climáticos"""
-    
-    current = data['current']
-    air = data['air_quality']
-    
-    # Ícone do tempo
-    icon_url = f"https://openweathermap.org/img/wn/{current['icon']}@4x.png"
-    
-    # Cor do cartão de qualidade do ar
-    aqi_colors = {
-        'Boa': '#28a745',
-        'Moderada': '#ffc107',
-        'Prejudicial para grupos sensíveis': '#fd7e14',
-        'Prejudicial': '#dc3545',
-        'Muito prejudicial': '#6f42c1'
-    }
-    aqi_color = aqi_colors.get(air['status'], '#6c757d')
-    
-    # Direção do vento
-    wind_directions = ['N', 'NE', 'E', 'SE', 'S', 'SW', 'W', 'NW']
-    wind_dir = wind_directions[round(current['wind_deg'] / 45) % 8]
-    
-    # Previsão diária
-    forecast_daily_html = ""
-    for day in data['forecast_daily']:
-        rain_html = f"<div class='rain'>💧 {day['rain']}mm</div>" if day['rain'] > 0 else ""
-        forecast_daily_html += f"""
-        <div class="forecast-day">
-            <div class="day-name">{day['weekday'][:3]}</div>
-            <div class="day-date">{day['date'][8:]}/{day['date'][5:7]}</div>
-            <img src="https://openweathermap.org/img/wn/{day['icon']}@2x.png" alt="{day['description']}">
-            <div class="temps">
-                <span class="temp-max">{day['temp_max']}°</span>
-                <span class="temp-min">{day['temp_min']}°</span>
-            </div>
-            <div class="description">{day['description'][:20]}</div>
-            {rain_html}
-        </div>
-        """
-    
-    # Previsão horária
-    forecast_hourly_html = ""
-    for hour in data['forecast_hourly']:
-        forecast_hourly_html += f"""
-        <div class="hour-card">
-            <div class="hour-time">{hour['time']}</div>
-            <img src="https://openweathermap.org/img/wn/{hour['icon']}@2x.png" alt="{hour['description']}">
-            <div class="hour-temp">{hour['temperature']}°C</div>
-            <div class="hour-wind">💨 {hour['wind_speed']} km/h</div>
-        </div>
-        """
-    
-    # Nota de demonstração
-    demo_note = ""
-    if data['metadata'].get('note'):
-        demo_note = f"""
-        <div class="demo-warning">
-            {data['metadata']['note']}
-        </div>
-        """
-    
-    html = f"""
-    <!DOCTYPE html>
-    <html lang="pt-BR">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>Clima e Tempo - {current['city']}</title>
-        <style>
-            * {{
+# Bloco de estilo estático da página: montado uma única vez no import em vez
+# de re-alocar os ~5 KB de CSS a cada request (só a cor do AQI é dinâmica)
+_CSS_TMPL = Template("""
+            * {
                 margin: 0;
                 padding: 0;
                 box-sizing: border-box;
-            }}
+            }
             
-            body {{
+            body {
                 font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif;
                 background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
                 min-height: 100vh;
                 padding: 20px;
-            }}
+            }
             
-            .container {{
+            .container {
                 max-width: 1200px;
                 margin: 0 auto;
-            }}
+            }
             
-            .demo-warning {{
+            .demo-warning {
                 background: #fff3cd;
                 color: #856404;
                 padding: 15px;
@@ -420,23 +695,23 @@ def generate_weather_html(data: Dict, city: str) -> str:
                 text-align: center;
                 font-weight: 600;
                 border: 2px solid #ffc107;
-            }}
+            }
             
-            .search-bar {{
+            .search-bar {
                 background: white;
                 padding: 20px;
                 border-radius: 16px;
                 box-shadow: 0 10px 30px rgba(0,0,0,0.2);
                 margin-bottom: 20px;
-            }}
+            }
             
-            .search-bar form {{
+            .search-bar form {
                 display: flex;
                 gap: 10px;
                 flex-wrap: wrap;
-            }}
+            }
             
-            .search-bar input {{
+            .search-bar input {
                 flex: 1;
                 min-width: 200px;
                 padding: 12px 20px;
@@ -444,14 +719,14 @@ def generate_weather_html(data: Dict, city: str) -> str:
                 border-radius: 10px;
                 font-size: 1rem;
                 transition: border-color 0.3s;
-            }}
+            }
             
-            .search-bar input:focus {{
+            .search-bar input:focus {
                 outline: none;
                 border-color: #667eea;
-            }}
+            }
             
-            .search-bar button {{
+            .search-bar button {
                 padding: 12px 30px;
                 background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
                 color: white;
@@ -461,263 +736,352 @@ def generate_weather_html(data: Dict, city: str) -> str:
                 font-weight: 600;
                 cursor: pointer;
                 transition: transform 0.2s;
-            }}
+            }
             
-            .search-bar button:hover {{
+            .search-bar button:hover {
                 transform: translateY(-2px);
-            }}
+            }
             
-            .main-weather {{
+            .main-weather {
                 background: linear-gradient(135deg, rgba(255,255,255,0.95) 0%, rgba(255,255,255,0.9) 100%);
                 padding: 40px;
                 border-radius: 24px;
                 box-shadow: 0 20px 60px rgba(0,0,0,0.3);
                 margin-bottom: 20px;
                 text-align: center;
-            }}
+            }
             
-            .location {{
+            .location {
                 font-size: 2rem;
                 font-weight: 700;
                 color: #2c3e50;
                 margin-bottom: 10px;
-            }}
+            }
             
-            .update-time {{
+            .update-time {
                 color: #7f8c8d;
                 font-size: 0.9rem;
                 margin-bottom: 30px;
-            }}
+            }
             
-            .current-temp {{
+            .current-temp {
                 display: flex;
                 align-items: center;
                 justify-content: center;
                 gap: 20px;
                 margin: 30px 0;
-            }}
+            }
             
-            .temp-icon img {{
+            .temp-icon img {
                 width: 150px;
                 height: 150px;
                 filter: drop-shadow(0 4px 8px rgba(0,0,0,0.1));
-            }}
+            }
             
-            .temp-value {{
+            .temp-value {
                 font-size: 5rem;
                 font-weight: 700;
                 color: #2c3e50;
                 line-height: 1;
-            }}
+            }
             
-            .temp-unit {{
+            .temp-unit {
                 font-size: 2rem;
                 color: #7f8c8d;
-            }}
+            }
             
-            .weather-description {{
+            .weather-description {
                 font-size: 1.5rem;
                 color: #34495e;
                 margin: 20px 0;
                 text-transform: capitalize;
-            }}
+            }
             
-            .feels-like {{
+            .feels-like {
                 color: #7f8c8d;
                 font-size: 1.1rem;
-            }}
+            }
             
-            .weather-details {{
+            .weather-details {
                 display: grid;
                 grid-template-columns: repeat(auto-fit, minmax(200px, 1fr));
                 gap: 15px;
                 margin-top: 30px;
-            }}
+            }
             
-            .detail-card {{
+            .detail-card {
                 background: rgba(102, 126, 234, 0.1);
                 padding: 20px;
                 border-radius: 12px;
                 text-align: center;
-            }}
+            }
             
-            .detail-label {{
+            .detail-label {
                 color: #7f8c8d;
                 font-size: 0.9rem;
                 margin-bottom: 8px;
-            }}
+            }
             
-            .detail-value {{
+            .detail-value {
                 font-size: 1.5rem;
                 font-weight: 700;
                 color: #2c3e50;
-            }}
+            }
             
-            .section {{
+            .section {
                 background: white;
                 padding: 30px;
                 border-radius: 16px;
                 box-shadow: 0 10px 30px rgba(0,0,0,0.2);
                 margin-bottom: 20px;
-            }}
+            }
             
-            .section-title {{
+            .section-title {
                 font-size: 1.5rem;
                 font-weight: 700;
                 color: #2c3e50;
                 margin-bottom: 20px;
                 padding-bottom: 10px;
                 border-bottom: 3px solid #667eea;
-            }}
+            }
             
-            .air-quality {{
+            .air-quality {
                 display: flex;
                 align-items: center;
                 gap: 20px;
                 padding: 20px;
-                background: {aqi_color};
+                background: $aqi_color;
                 color: white;
                 border-radius: 12px;
-            }}
+            }
             
-            .aqi-value {{
+            .aqi-value {
                 font-size: 3rem;
                 font-weight: 700;
-            }}
+            }
             
-            .aqi-info {{
+            .aqi-info {
                 flex: 1;
-            }}
+            }
             
-            .aqi-status {{
+            .aqi-status {
                 font-size: 1.5rem;
                 font-weight: 600;
                 margin-bottom: 10px;
-            }}
+            }
             
-            .aqi-components {{
+            .aqi-components {
                 display: grid;
                 grid-template-columns: repeat(auto-fit, minmax(100px, 1fr));
                 gap: 10px;
                 margin-top: 20px;
-            }}
+            }
             
-            .aqi-component {{
+            .aqi-component {
                 background: rgba(255,255,255,0.2);
                 padding: 10px;
                 border-radius: 8px;
                 text-align: center;
-            }}
+            }
             
-            .forecast-daily {{
+            .forecast-daily {
                 display: grid;
                 grid-template-columns: repeat(auto-fit, minmax(140px, 1fr));
                 gap: 15px;
-            }}
+            }
             
-            .forecast-day {{
+            .forecast-day {
                 background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
                 color: white;
                 padding: 20px;
                 border-radius: 12px;
                 text-align: center;
-            }}
+            }
             
-            .day-name {{
+            .day-name {
                 font-size: 1.2rem;
                 font-weight: 700;
                 margin-bottom: 5px;
-            }}
+            }
             
-            .day-date {{
+            .day-date {
                 font-size: 0.9rem;
                 opacity: 0.8;
                 margin-bottom: 10px;
-            }}
+            }
             
-            .forecast-day img {{
+            .forecast-day img {
                 width: 80px;
                 height: 80px;
-            }}
+            }
             
-            .temps {{
+            .temps {
                 display: flex;
                 justify-content: center;
                 gap: 10px;
                 font-size: 1.3rem;
                 font-weight: 700;
                 margin: 10px 0;
-            }}
+            }
             
-            .temp-min {{
+            .temp-min {
                 opacity: 0.7;
-            }}
+            }
             
-            .description {{
+            .description {
                 font-size: 0.85rem;
                 opacity: 0.9;
-            }}
+            }
             
-            .rain {{
+            .rain {
                 margin-top: 10px;
                 font-size: 0.9rem;
                 background: rgba(255,255,255,0.2);
                 padding: 5px;
                 border-radius: 5px;
-            }}
+            }
             
-            .forecast-hourly {{
+            .forecast-hourly {
                 display: flex;
                 gap: 15px;
                 overflow-x: auto;
                 padding: 10px 0;
-            }}
+            }
             
-            .hour-card {{
+            .hour-card {
                 background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
                 color: white;
                 padding: 15px;
                 border-radius: 12px;
                 text-align: center;
                 min-width: 100px;
-            }}
+            }
             
-            .hour-time {{
+            .hour-time {
                 font-weight: 700;
                 margin-bottom: 10px;
-            }}
+            }
             
-            .hour-card img {{
+            .hour-card img {
                 width: 50px;
                 height: 50px;
-            }}
+            }
             
-            .hour-temp {{
+            .hour-temp {
                 font-size: 1.2rem;
                 font-weight: 700;
                 margin: 10px 0;
-            }}
+            }
             
-            .hour-wind {{
+            .hour-wind {
                 font-size: 0.85rem;
                 opacity: 0.9;
-            }}
+            }
             
-            @media (max-width: 768px) {{
-                .current-temp {{
+            @media (max-width: 768px) {
+                .current-temp {
                     flex-direction: column;
-                }}
+                }
                 
-                .temp-value {{
+                .temp-value {
                     font-size: 4rem;
-                }}
+                }
                 
-                .temp-icon img {{
+                .temp-icon img {
                     width: 120px;
                     height: 120px;
-                }}
-            }}
-        </style>
+                }
+            }
+""")
+
+
+# Cartões de previsão pré-compilados: a constante é criada uma vez no import e
+# cada iteração só faz o format_map do dicionário de visualização
+_DAY_TMPL = """
+        <div class="forecast-day">
+            <div class="day-name">{wd3}</div>
+            <div class="day-date">{dd}/{mm}</div>
+            <img src="https://openweathermap.org/img/wn/{icon}@2x.png" alt="{description}">
+            <div class="temps">
+                <span class="temp-max">{temp_max}°</span>
+                <span class="temp-min">{temp_min}°</span>
+            </div>
+            <div class="description">{desc20}</div>
+            {rain_html}
+        </div>
+        """
+
+_HOUR_TMPL = """
+        <div class="hour-card">
+            <div class="hour-time">{time}</div>
+            <img src="https://openweathermap.org/img/wn/{icon}@2x.png" alt="{description}">
+            <div class="hour-temp">{temperature}°C</div>
+            <div class="hour-wind">💨 {wind_speed} km/h</div>
+        </div>
+        """
+
+
+def generate_weather_html(data: Dict, city: str) -> str:
+    """Gera página HTML com os dados climáticos"""
+    
+    current = data['current']
+    air = data['air_quality']
+    
+    # Ícone do tempo
+    icon_url = f"https://openweathermap.org/img/wn/{current['icon']}@4x.png"
+    
+    # Cor do cartão de qualidade do ar
+    aqi_color = _AQI_COLORS.get(air['status'], '#6c757d')
+    
+    # Direção do vento: setor de 45° por aritmética inteira, equivalente a
+    # round(deg/45) % 8 para graus não-negativos e sem arredondamento bancário
+    wind_dir = _WIND_DIRS[((int(current['wind_deg']) + 22) // 45) & 7]
+    
+    # Previsão diária (acumula fragmentos e junta de uma vez, sem += de string)
+    daily_parts = []
+    for day in data['forecast_daily']:
+        daily_parts.append(_DAY_TMPL.format_map({
+            'wd3': day['weekday'][:3],
+            'dd': day['date'][8:],
+            'mm': day['date'][5:7],
+            'icon': day['icon'],
+            'description': day['description'],
+            'temp_max': day['temp_max'],
+            'temp_min': day['temp_min'],
+            'desc20': day['description'][:20],
+            'rain_html': f"<div class='rain'>💧 {day['rain']}mm</div>" if day['rain'] > 0 else ""
+        }))
+    forecast_daily_html = "".join(daily_parts)
+
+    # Previsão horária
+    hourly_parts = []
+    for hour in data['forecast_hourly']:
+        hourly_parts.append(_HOUR_TMPL.format_map({
+            'time': hour['time'],
+            'icon': hour['icon'],
+            'description': hour['description'],
+            'temperature': hour['temperature'],
+            'wind_speed': hour['wind_speed']
+        }))
+    forecast_hourly_html = "".join(hourly_parts)
+    
+    # Nota de demonstração
+    demo_note = ""
+    if data['metadata'].get('note'):
+        demo_note = f"""
+        <div class="demo-warning">
+            {data['metadata']['note']}
+        </div>
+        """
+    
+    html = f"""
+    <!DOCTYPE html>
+    <html lang="pt-BR">
+    <head>
+        <meta charset="UTF-8">
+        <meta name="viewport" content="width=device-width, initial-scale=1.0">
+        <title>Clima e Tempo - {current['city']}</title>
+        <style>{_CSS_TMPL.substitute(aqi_color=aqi_color)}</style>
     </head>
     <body>
         <div class="container">